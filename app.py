@@ -1,179 +1,354 @@
 # app.py
+import time
 import streamlit as st
-from session_manager import init_session, is_logged_in, logout_user
-from auth import authenticate, register_user
+from session_manager import init_session, is_logged_in, logout_user, cached, invalidate
+from auth import authenticate, register_user, get_user_summary
 from characters import create_character, get_characters, delete_character
-from dreams import create_dream, get_dreams
+from dreams import create_dream, get_dreams, create_dream_batch, get_dream_batch
+from exports import start_export, get_export
+from search import search
+from timing import timed, record_run
 import base64
 
+run_started = time.perf_counter()
+
 st.set_page_config(page_title="AI Dream Creator", layout="centered", page_icon="🌙")
 
 init_session()
 
-if is_logged_in():
-    user = st.session_state.user
+# Each tab is a fragment: widgets inside it rerun only that tab, and only the
+# open tab runs on a full rerun. Listings come from the session cache so
+# switching back to a tab does not refetch them.
+
+@st.fragment
+@timed("profile_tab")
+def profile_tab(user):
+    st.subheader(f"Welcome, {user['name']}! 👋")
+    st.write(f"**Email:** {user['email']}")
+    st.write(f"**Member since:** {user.get('created_at', 'Today')}")
     
-    # Header with logout
+    summary = cached("summary", lambda: get_user_summary(user['email']))
+    if summary:
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Characters", summary['character_count'])
+        col2.metric("Dreams", summary['dream_count'])
+        col3.metric("In progress", summary['jobs_in_flight'])
+        if summary.get('last_activity_at'):
+            st.write(f"**Last activity:** {summary['last_activity_at']}")
+        if summary.get('recent_dream_ids'):
+            st.caption("Recent dreams: " + ", ".join(d[:8] for d in summary['recent_dream_ids']))
+    
+    st.divider()
+    st.subheader("📦 Export Your Data")
     col1, col2 = st.columns([3, 1])
     with col1:
-        st.title("🌙 AI Dream Creator")
+        if st.button("Export characters and dreams", key="start_export"):
+            success, export_id = start_export(user['email'])
+            if success:
+                st.session_state.export_id = export_id
+                invalidate("export")
+            else:
+                st.error("Failed to start export. Please try again.")
     with col2:
-        if st.button("🚪 Logout", type="secondary"):
-            logout_user()
-            st.rerun()
+        if st.session_state.get("export_id") and st.button("🔄 Refresh", key="refresh_export"):
+            invalidate("export")
     
-    # Tabs for Profile, Characters, and Dreams
-    tab1, tab2, tab3 = st.tabs(["👤 Profile", "🎭 Characters", "🌙 Dreams"])
+    if st.session_state.get("export_id"):
+        export = cached("export", lambda: get_export(user['email']))
+        if export:
+            status = export.get('status')
+            if status == 'completed':
+                st.success("✅ Export ready")
+                st.link_button("⬇️ Download archive", export['download_url'])
+            elif status == 'failed':
+                st.error("❌ Export failed")
+            else:
+                total = export.get('items_total', 0)
+                done = export.get('items_done', 0)
+                st.progress(done / total if total else 0, text=f"{status.capitalize()}: {done}/{total} files")
+
+@st.fragment
+@timed("characters_tab")
+def characters_tab(user):
+    st.subheader("Manage Your Characters")
     
-    with tab1:
-        st.subheader(f"Welcome, {user['name']}! 👋")
-        st.write(f"**Email:** {user['email']}")
-        st.write(f"**Member since:** {user.get('created_at', 'Today')}")
+    # Add new character
+    with st.expander("➕ Add New Character", expanded=False):
+        with st.form("character_form", clear_on_submit=True):
+            char_name = st.text_input("Character Name", placeholder="e.g., Me, My Brother, Iron Man")
+            char_desc = st.text_area("Description", placeholder="Describe the character...")
+            
+            st.write("Upload up to 3 images:")
+            img1 = st.file_uploader("Image 1", type=["jpg", "jpeg", "png"], key="img1")
+            img2 = st.file_uploader("Image 2", type=["jpg", "jpeg", "png"], key="img2")
+            img3 = st.file_uploader("Image 3", type=["jpg", "jpeg", "png"], key="img3")
+            
+            submitted = st.form_submit_button("Create Character", type="primary")
+            
+            if submitted:
+                if char_name:
+                    images = [img for img in [img1, img2, img3] if img]
+                    if images:
+                        if create_character(user['email'], char_name, char_desc, images):
+                            st.success(f"Character '{char_name}' created!")
+                            # The Dreams and Profile tabs show characters too, so rerun the whole app
+                            invalidate("characters", "summary", "search")
+                            st.rerun()
+                        else:
+                            st.error("Failed to create character")
+                    else:
+                        st.warning("Please upload at least one image")
+                else:
+                    st.warning("Please enter a character name")
     
-    with tab2:
-        st.subheader("Manage Your Characters")
+    st.divider()
+    
+    # Display characters
+    characters = cached("characters", lambda: get_characters(user['email']))
+    
+    if characters:
+        for char in characters:
+            with st.container():
+                col1, col2 = st.columns([4, 1])
+                
+                with col1:
+                    st.subheader(char['name'])
+                    if char.get('description'):
+                        st.write(char['description'])
+                    
+                    # Display images from S3
+                    if char.get('image_urls'):
+                        cols = st.columns(min(len(char['image_urls']), 3))
+                        for idx, img_url in enumerate(char['image_urls'][:3]):
+                            with cols[idx]:
+                                st.image(img_url, width='stretch')
+                
+                with col2:
+                    if st.button("🗑️ Delete", key=f"del_{char['character_id']}"):
+                        if delete_character(user['email'], char['character_id']):
+                            st.success("Deleted!")
+                            invalidate("characters", "summary", "search")
+                            st.rerun()
+                
+                st.divider()
+    else:
+        st.info("No characters yet. Create your first character above!")
+
+@st.fragment
+@timed("dreams_tab")
+def dreams_tab(user):
+    st.subheader("Create Dream Videos")
+    
+    characters = cached("characters", lambda: get_characters(user['email']))
+    
+    if characters:
+        with st.expander("✨ Create New Dream", expanded=False):
+            with st.form("dream_form", clear_on_submit=True):
+                char_names = {char['name']: char for char in characters}
+                selected_char_name = st.selectbox("Select Character", list(char_names.keys()))
+                selected_char = char_names[selected_char_name]
+                
+                if selected_char.get('image_urls'):
+                    st.write("Character images:")
+                    cols = st.columns(min(len(selected_char['image_urls']), 3))
+                    for idx, img_url in enumerate(selected_char['image_urls'][:3]):
+                        with cols[idx]:
+                            st.image(img_url, width='stretch')
+                    
+                    selected_img_idx = st.radio(
+                        "Select image for video", 
+                        range(len(selected_char['image_urls'])), 
+                        format_func=lambda x: f"Image {x+1}"
+                    )
+                else:
+                    st.error("Selected character has no images!")
+                    selected_img_idx = 0
+                
+                dream_prompt = st.text_input("Dream Prompt (optional)", placeholder="e.g., walking in forest", max_chars=100, key="dream_prompt")
+                st.info("Video: 2 sec, 360p, 12fps (low cost) with Nova Reel")
+                
+                submitted = st.form_submit_button("Generate Dream Video", type="primary")
+                
+                if submitted:
+                    if selected_char.get('image_urls'):
+                        with st.spinner("Creating your dream... This may take a minute..."):
+                            success, dream_id = create_dream(
+                                user['email'], 
+                                selected_char['character_id'], 
+                                dream_prompt, 
+                                selected_img_idx
+                            )
+                            if success:
+                                st.success(f"Dream created! Dream ID: {dream_id}")
+                                # Profile counts change too, so rerun the whole app
+                                invalidate("dreams", "summary", "search")
+                                st.rerun()
+                            else:
+                                st.error("Failed to create dream. Please try again.")
+                    else:
+                        st.error("Character has no images to create video!")
         
-        # Add new character
-        with st.expander("➕ Add New Character", expanded=False):
-            with st.form("character_form", clear_on_submit=True):
-                char_name = st.text_input("Character Name", placeholder="e.g., Me, My Brother, Iron Man")
-                char_desc = st.text_area("Description", placeholder="Describe the character...")
+        with st.expander("🧪 Batch Dreams", expanded=False):
+            with st.form("dream_batch_form", clear_on_submit=True):
+                char_names = {char['name']: char for char in characters}
+                batch_char_name = st.selectbox("Select Character", list(char_names.keys()), key="batch_char")
+                batch_char = char_names[batch_char_name]
                 
-                st.write("Upload up to 3 images:")
-                img1 = st.file_uploader("Image 1", type=["jpg", "jpeg", "png"], key="img1")
-                img2 = st.file_uploader("Image 2", type=["jpg", "jpeg", "png"], key="img2")
-                img3 = st.file_uploader("Image 3", type=["jpg", "jpeg", "png"], key="img3")
+                batch_img_idxs = st.multiselect(
+                    "Images to use",
+                    range(len(batch_char.get('image_urls', []))),
+                    format_func=lambda x: f"Image {x+1}",
+                    key="batch_images"
+                )
+                batch_prompts = st.text_area("Dream Prompts (one per line)", placeholder="walking in forest\nflying over a city", key="batch_prompts")
+                st.info("Every prompt is generated with every selected image (up to 24 videos)")
                 
-                submitted = st.form_submit_button("Create Character", type="primary")
+                submitted = st.form_submit_button("Generate Batch", type="primary")
                 
                 if submitted:
-                    if char_name:
-                        images = [img for img in [img1, img2, img3] if img]
-                        if images:
-                            if create_character(user['email'], char_name, char_desc, images):
-                                st.success(f"Character '{char_name}' created!")
+                    prompts = [line.strip() for line in batch_prompts.splitlines() if line.strip()]
+                    if not batch_img_idxs:
+                        st.warning("Please select at least one image")
+                    elif len(prompts or [""]) * len(batch_img_idxs) > 24:
+                        st.warning("A batch can hold at most 24 videos")
+                    else:
+                        with st.spinner("Creating your dreams..."):
+                            success, batch_id = create_dream_batch(
+                                user['email'],
+                                batch_char['character_id'],
+                                prompts,
+                                batch_img_idxs
+                            )
+                            if success:
+                                st.session_state.last_batch_id = batch_id
+                                invalidate("dreams", "summary", "search")
                                 st.rerun()
                             else:
-                                st.error("Failed to create character")
-                        else:
-                            st.warning("Please upload at least one image")
+                                st.error("Failed to create batch. Please try again.")
+        
+        with st.expander("🔍 Search", expanded=bool(st.session_state.get("search_params"))):
+            with st.form("search_form"):
+                query = st.text_input("Search prompts and characters", placeholder="e.g., fore", key="search_query")
+                status_filter = st.selectbox("Status", ["Any", "completed", "processing", "demo", "failed"], key="search_status")
+                col1, col2 = st.columns(2)
+                with col1:
+                    date_from = st.date_input("Created from", value=None, key="search_from")
+                with col2:
+                    date_to = st.date_input("Created to", value=None, key="search_to")
+                
+                if st.form_submit_button("Search"):
+                    if query.strip():
+                        st.session_state.search_params = {
+                            "query": query,
+                            "status": None if status_filter == "Any" else status_filter,
+                            "date_from": date_from.isoformat() if date_from else None,
+                            "date_to": date_to.isoformat() if date_to else None
+                        }
+                        st.session_state.search_cursor = None
+                        invalidate("search")
                     else:
-                        st.warning("Please enter a character name")
+                        st.warning("Please enter a search term")
+            
+            params = st.session_state.get("search_params")
+            if params:
+                cursor = st.session_state.get("search_cursor")
+                results, total, next_cursor = cached(
+                    "search",
+                    lambda: search(user['email'], cursor=cursor, **params)
+                )
+                st.caption(f"{total} match{'es' if total != 1 else ''}")
+                for result in results:
+                    item = result['item']
+                    if result['type'] == 'dream':
+                        st.write(f"🌙 **{item.get('prompt') or 'No prompt'}** · {item.get('character_name', '')} · {item.get('status')} · {item.get('created_at')}")
+                    else:
+                        st.write(f"🎭 **{item['name']}** · {item.get('description', '')} · {item.get('created_at')}")
+                
+                col1, col2 = st.columns(2)
+                with col1:
+                    if cursor and st.button("⏮️ First page", key="search_first"):
+                        st.session_state.search_cursor = None
+                        invalidate("search")
+                        st.rerun(scope="fragment")
+                with col2:
+                    if next_cursor and st.button("Next page ➡️", key="search_next"):
+                        st.session_state.search_cursor = next_cursor
+                        invalidate("search")
+                        st.rerun(scope="fragment")
         
         st.divider()
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            st.subheader("Dream History")
+        with col2:
+            if st.button("🔄 Refresh", key="refresh_dreams"):
+                invalidate("dreams", f"batch:{st.session_state.get('last_batch_id')}")
+        
+        batch_id = st.session_state.get("last_batch_id")
+        if batch_id:
+            batch = cached(f"batch:{batch_id}", lambda: get_dream_batch(user['email'], batch_id))
+            if batch:
+                done = batch['total'] - batch['counts'].get('processing', 0)
+                st.progress(batch['progress'], text=f"Batch {batch_id[:8]}: {done}/{batch['total']} finished")
+                st.caption(" · ".join(f"{status}: {count}" for status, count in batch['counts'].items()))
         
-        # Display characters
-        characters = get_characters(user['email'])
+        dreams = cached("dreams", lambda: get_dreams(user['email']))
         
-        if characters:
-            for char in characters:
+        if dreams:
+            for dream in sorted(dreams, key=lambda x: x.get('created_at', ''), reverse=True):
                 with st.container():
-                    col1, col2 = st.columns([4, 1])
+                    col1, col2 = st.columns([3, 1])
                     
                     with col1:
-                        st.subheader(char['name'])
-                        if char.get('description'):
-                            st.write(char['description'])
+                        st.write(f"**Prompt:** {dream.get('prompt', 'No prompt')}")
+                        st.write(f"**Created:** {dream.get('created_at')}")
                         
-                        # Display images from S3
-                        if char.get('image_urls'):
-                            cols = st.columns(min(len(char['image_urls']), 3))
-                            for idx, img_url in enumerate(char['image_urls'][:3]):
-                                with cols[idx]:
-                                    st.image(img_url, width='stretch')
+                        status = dream.get('status', 'unknown')
+                        if status == 'completed':
+                            st.success("✅ Completed")
+                            if dream.get('video_url'):
+                                st.video(dream['video_url'])
+                        elif status == 'processing':
+                            st.info("⏳ Processing...")
+                        else:
+                            st.error("❌ Failed")
                     
                     with col2:
-                        if st.button("🗑️ Delete", key=f"del_{char['character_id']}"):
-                            if delete_character(user['email'], char['character_id']):
-                                st.success("Deleted!")
-                                st.rerun()
+                        st.write(f"**Status:** {status}")
                     
                     st.divider()
         else:
-            st.info("No characters yet. Create your first character above!")
+            st.info("No dreams yet. Create your first dream above!")
+    else:
+        st.warning("Please create at least one character first!")
+
+if is_logged_in():
+    user = st.session_state.user
     
-    with tab3:
-        st.subheader("Create Dream Videos")
-        
-        characters = get_characters(user['email'])
-        
-        if characters:
-            with st.expander("✨ Create New Dream", expanded=False):
-                with st.form("dream_form", clear_on_submit=True):
-                    char_names = {char['name']: char for char in characters}
-                    selected_char_name = st.selectbox("Select Character", list(char_names.keys()))
-                    selected_char = char_names[selected_char_name]
-                    
-                    if selected_char.get('image_urls'):
-                        st.write("Character images:")
-                        cols = st.columns(min(len(selected_char['image_urls']), 3))
-                        for idx, img_url in enumerate(selected_char['image_urls'][:3]):
-                            with cols[idx]:
-                                st.image(img_url, width='stretch')
-                        
-                        selected_img_idx = st.radio(
-                            "Select image for video", 
-                            range(len(selected_char['image_urls'])), 
-                            format_func=lambda x: f"Image {x+1}"
-                        )
-                    else:
-                        st.error("Selected character has no images!")
-                        selected_img_idx = 0
-                    
-                    dream_prompt = st.text_input("Dream Prompt (optional)", placeholder="e.g., walking in forest", max_chars=100)
-                    st.info("Video: 2 sec, 360p, 12fps (low cost) with Nova Reel")
-                    
-                    submitted = st.form_submit_button("Generate Dream Video", type="primary")
-                    
-                    if submitted:
-                        if selected_char.get('image_urls'):
-                            with st.spinner("Creating your dream... This may take a minute..."):
-                                success, dream_id = create_dream(
-                                    user['email'], 
-                                    selected_char['character_id'], 
-                                    dream_prompt, 
-                                    selected_img_idx
-                                )
-                                if success:
-                                    st.success(f"Dream created! Dream ID: {dream_id}")
-                                    st.rerun()
-                                else:
-                                    st.error("Failed to create dream. Please try again.")
-                        else:
-                            st.error("Character has no images to create video!")
-            
-            st.divider()
-            st.subheader("Dream History")
-            
-            dreams = get_dreams(user['email'])
-            
-            if dreams:
-                for dream in sorted(dreams, key=lambda x: x.get('created_at', ''), reverse=True):
-                    with st.container():
-                        col1, col2 = st.columns([3, 1])
-                        
-                        with col1:
-                            st.write(f"**Prompt:** {dream.get('prompt', 'No prompt')}")
-                            st.write(f"**Created:** {dream.get('created_at')}")
-                            
-                            status = dream.get('status', 'unknown')
-                            if status == 'completed':
-                                st.success("✅ Completed")
-                                if dream.get('video_url'):
-                                    st.video(dream['video_url'])
-                            elif status == 'processing':
-                                st.info("⏳ Processing...")
-                            else:
-                                st.error("❌ Failed")
-                        
-                        with col2:
-                            st.write(f"**Status:** {status}")
-                        
-                        st.divider()
-            else:
-                st.info("No dreams yet. Create your first dream above!")
-        else:
-            st.warning("Please create at least one character first!")
+    # Header with logout
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.title("🌙 AI Dream Creator")
+    with col2:
+        if st.button("🚪 Logout", type="secondary"):
+            logout_user()
+            st.rerun()
+    
+    # Tabs for Profile, Characters, and Dreams
+    # Lazy tabs: switching reruns the app and only the open tab's body runs
+    tab1, tab2, tab3 = st.tabs(["👤 Profile", "🎭 Characters", "🌙 Dreams"], key="main_tab", on_change="rerun")
+    
+    if tab1.open:
+        with tab1:
+            profile_tab(user)
+    
+    if tab2.open:
+        with tab2:
+            characters_tab(user)
+    
+    if tab3.open:
+        with tab3:
+            dreams_tab(user)
     
 else:
     # Login/Register Page
@@ -214,4 +389,6 @@ else:
                 else:
                     st.error("Email already exists")
             else:
-                st.warning("Please fill all fields")
\ No newline at end of file
+                st.warning("Please fill all fields")
+
+record_run("app", run_started)
@@ -71,3 +71,9 @@ def authenticate(email, password):
     if result.get("success"):
         return result.get("user")
     return None
+
+def get_user_summary(email):
+    result = api_call("get_summary", {"email": email})
+    if result.get("success"):
+        return result.get("summary")
+    return None
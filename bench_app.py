@@ -0,0 +1,290 @@
+# bench_app.py
+"""Headless multi-session benchmark for app.py.
+
+Drives N simulated Streamlit sessions through login -> characters -> dreams
+with Streamlit's AppTest, against an in-memory stand-in for the Lambda backend
+(`auth.api_call`) with configurable latency. Reports script run time per
+rerun, backend calls per interaction and session_state size per session, and
+exits non-zero when an interaction calls the same backend action more than
+once (e.g. duplicate get_characters).
+
+    python bench_app.py --sessions 20 --latency 0.05
+"""
+import argparse
+import contextlib
+import io
+import logging
+import pickle
+import statistics
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from unittest import mock
+
+from streamlit.testing.v1 import AppTest
+
+import auth
+import characters
+import dreams
+import exports
+import search
+
+DEMO_VIDEO_URL = "https://commondatastorage.googleapis.com/gtv-videos-bucket/sample/BigBuckBunny.mp4"
+
+
+class FakeBackend:
+    """In-memory Lambda stand-in that counts calls per user email"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.users = {}
+        self.characters = {}
+        self.dreams = {}
+        self.calls = defaultdict(Counter)
+
+    def seed_user(self, email, n_characters=3, n_dreams=5):
+        self.users[email] = {"email": email, "name": email.split("@")[0], "password": "bench",
+                             "created_at": "2024-01-15 10:30"}
+        for i in range(n_characters):
+            char_id = str(uuid.uuid4())
+            self.characters[char_id] = {
+                "character_id": char_id, "email": email, "name": f"Character {i}",
+                "description": "Benchmark character",
+                "image_urls": [f"https://example.com/{char_id}/{n}.jpg" for n in range(3)],
+                "created_at": "2024-01-15 10:30"
+            }
+        char_ids = list(self.characters)
+        for i in range(n_dreams):
+            self._add_dream(email, char_ids[-1], f"benchmark dream {i}")
+
+    def _add_dream(self, email, character_id, prompt, batch_id=None):
+        dream_id = str(uuid.uuid4())
+        self.dreams[dream_id] = {
+            "dream_id": dream_id, "email": email, "character_id": character_id,
+            "prompt": prompt, "video_url": DEMO_VIDEO_URL, "status": "demo",
+            "batch_id": batch_id, "created_at": time.strftime("%Y-%m-%d %H:%M")
+        }
+        return dream_id
+
+    def snapshot(self, email):
+        with self.lock:
+            return Counter(self.calls[email])
+
+    def __call__(self, action, data={}):
+        data = dict(data)
+        email = data.get("email")
+        with self.lock:
+            self.calls[email][action] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        handler = getattr(self, f"do_{action}", None)
+        if handler is None:
+            return {"error": "Unknown action"}
+        with self.lock:
+            return handler(data)
+
+    def do_login(self, data):
+        user = self.users.get(data["email"])
+        if not user or user["password"] != data["password"]:
+            return {"error": "Invalid password"}
+        return {"success": True, "user": {k: v for k, v in user.items() if k != "password"}}
+
+    def do_get_characters(self, data):
+        return {"success": True, "characters": [dict(c) for c in self.characters.values()
+                                                if c["email"] == data["email"]]}
+
+    def do_delete_character(self, data):
+        char = self.characters.get(data["character_id"])
+        if not char or char["email"] != data["email"]:
+            return {"error": "Character not found"}
+        del self.characters[data["character_id"]]
+        return {"success": True}
+
+    def do_get_dreams(self, data):
+        return {"success": True, "dreams": [dict(d) for d in self.dreams.values()
+                                            if d["email"] == data["email"]]}
+
+    def do_create_dream(self, data):
+        dream_id = self._add_dream(data["email"], data["character_id"], data.get("prompt", ""))
+        return {"success": True, "dream_id": dream_id, "video_url": DEMO_VIDEO_URL, "status": "demo"}
+
+    def do_create_dream_batch(self, data):
+        batch_id = str(uuid.uuid4())
+        ids = [self._add_dream(data["email"], data["character_id"], prompt, batch_id)
+               for prompt in data.get("prompts") or [""] for _ in data.get("image_indexes") or [0]]
+        return {"success": True, "batch_id": batch_id, "dream_ids": ids, "total": len(ids)}
+
+    def do_get_dream_batch(self, data):
+        batch = [d for d in self.dreams.values() if d.get("batch_id") == data["batch_id"]]
+        return {"success": True, "batch_id": data["batch_id"], "total": len(batch),
+                "counts": dict(Counter(d["status"] for d in batch)), "progress": 1 if batch else 0,
+                "dreams": batch}
+
+    def do_search(self, data):
+        words = data["query"].lower().split()
+        docs = [("dream", d, f"{d['prompt']}") for d in self.dreams.values() if d["email"] == data["email"]]
+        docs += [("character", c, f"{c['name']} {c['description']}") for c in self.characters.values()
+                 if c["email"] == data["email"]]
+        found = [{"type": t, "item": dict(item)} for t, item, text in docs
+                 if all(any(tok.startswith(w) for tok in text.lower().split()) for w in words)]
+        offset = int(data.get("cursor") or 0)
+        page_size = data.get("page_size", 20)
+        more = offset + page_size < len(found)
+        return {"success": True, "results": found[offset:offset + page_size], "total": len(found),
+                "next_cursor": str(offset + page_size) if more else None}
+
+    def do_get_summary(self, data):
+        email = data["email"]
+        owned = [d for d in self.dreams.values() if d["email"] == email]
+        return {"success": True, "summary": {
+            "character_count": sum(c["email"] == email for c in self.characters.values()),
+            "dream_count": len(owned), "jobs_in_flight": 0,
+            "last_activity_at": time.strftime("%Y-%m-%d %H:%M"),
+            "recent_dream_ids": [d["dream_id"] for d in owned[-5:]]
+        }}
+
+
+def state_size(at):
+    """Approximate bytes held in session_state, measured as its pickled size"""
+    total = 0
+    for key in at.session_state:
+        try:
+            total += len(pickle.dumps(at.session_state[key]))
+        except Exception:
+            pass
+    return total
+
+
+def find_button(at, label=None, key=None):
+    for button in at.button:
+        if (label is not None and button.label == label) or (key is not None and button.key == key):
+            return button
+    raise LookupError(f"Button not found: {label or key}")
+
+
+class Session:
+    """One simulated browser session driven through the benchmark flow"""
+
+    def __init__(self, backend, email, timeout):
+        self.backend = backend
+        self.email = email
+        self.at = AppTest.from_file("app.py", default_timeout=timeout)
+        self.results = []
+
+    def steps(self):
+        return [
+            ("open", None),
+            ("login", self.login),
+            ("rerun", None),
+            ("open_dreams", lambda: self.open_tab("🌙 Dreams")),
+            ("refresh_dreams", self.refresh_dreams),
+            ("search", self.search),
+            ("create_dream", self.create_dream),
+            ("open_characters", lambda: self.open_tab("🎭 Characters")),
+            ("delete_character", self.delete_character),
+        ]
+
+    def interact(self, name, action=None):
+        before = self.backend.snapshot(self.email)
+        if action:
+            action()
+        started = time.perf_counter()
+        self.at.run()
+        elapsed = time.perf_counter() - started
+        if self.at.exception:
+            raise RuntimeError(f"{name} failed for {self.email}: {self.at.exception[0].message}")
+        calls = self.backend.snapshot(self.email) - before
+        self.results.append({"interaction": name, "seconds": elapsed, "calls": calls})
+
+    def open_tab(self, label):
+        # Tabs are lazy, so selecting one is a keyed widget change plus a rerun
+        self.at.session_state["main_tab"] = label
+
+    def login(self):
+        self.at.text_input(key="login_email").input(self.email)
+        self.at.text_input(key="login_password").input("bench")
+        find_button(self.at, label="Login").click()
+
+    def create_dream(self):
+        self.at.text_input(key="dream_prompt").input("benchmark prompt")
+        find_button(self.at, label="Generate Dream Video").click()
+
+    def search(self):
+        self.at.text_input(key="search_query").input("bench")
+        find_button(self.at, label="Search").click()
+
+    def refresh_dreams(self):
+        find_button(self.at, key="refresh_dreams").click()
+
+    def delete_character(self):
+        next(b for b in self.at.button if (b.key or "").startswith("del_")).click()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10, help="number of simulated sessions")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every backend call")
+    parser.add_argument("--timeout", type=float, default=30, help="AppTest timeout per run")
+    parser.add_argument("--verbose", action="store_true", help="show the app's own debug output")
+    args = parser.parse_args()
+
+    # Reading session_state outside a script run is expected here
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(
+        lambda record: "missing ScriptRunContext" not in record.getMessage())
+
+    backend = FakeBackend(latency=args.latency)
+    emails = [f"bench{i}@example.com" for i in range(args.sessions)]
+    for email in emails:
+        backend.seed_user(email)
+
+    # Page modules bind api_call at import, so patch each module's reference;
+    # a missed one would reach the real Lambda URL instead of the fake backend
+    app_output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with mock.patch.object(auth, "api_call", backend), \
+            mock.patch.object(characters, "api_call", backend), \
+            mock.patch.object(dreams, "api_call", backend), \
+            mock.patch.object(exports, "api_call", backend), \
+            mock.patch.object(search, "api_call", backend), \
+            app_output:
+        # AppTest shares one runtime per process, so sessions stay alive side by
+        # side and are stepped round-robin rather than from parallel threads
+        sessions = [Session(backend, email, args.timeout) for email in emails]
+        for step in range(len(sessions[0].steps())):
+            for session in sessions:
+                session.interact(*session.steps()[step])
+
+    by_interaction = defaultdict(list)
+    regressions = []
+    for session in sessions:
+        for result in session.results:
+            by_interaction[result["interaction"]].append(result)
+            for action, count in result["calls"].items():
+                if count > 1:
+                    regressions.append(f"{session.email} {result['interaction']}: {action} called {count}x")
+
+    print(f"{args.sessions} sessions, backend latency {args.latency * 1000:.0f} ms\n")
+    print(f"{'interaction':<18}{'mean ms':>10}{'p95 ms':>10}{'calls':>8}  actions")
+    for name, results in by_interaction.items():
+        times = sorted(r["seconds"] * 1000 for r in results)
+        p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+        calls = sum((r["calls"] for r in results), Counter())
+        per_session = sum(calls.values()) / len(results)
+        actions = ", ".join(f"{a}={n / len(results):g}" for a, n in sorted(calls.items()))
+        print(f"{name:<18}{statistics.mean(times):>10.1f}{p95:>10.1f}{per_session:>8.1f}  {actions}")
+
+    state_sizes = [state_size(s.at) for s in sessions]
+    print(f"\nsession_state: mean {statistics.mean(state_sizes) / 1024:.1f} KiB, "
+          f"max {max(state_sizes) / 1024:.1f} KiB per session")
+
+    if regressions:
+        print("\nDuplicate backend calls:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
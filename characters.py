@@ -1,19 +1,34 @@
 import base64
+import hashlib
 from auth import api_call
 
 def create_character(email, name, description, image_files):
     """Create a new character with images"""
-    images = []
+    contents = {}
+    image_hashes = []
     for img_file in image_files:
         if img_file:
-            images.append(base64.b64encode(img_file.read()).decode())
-    
-    result = api_call("create_character", {
-        "email": email,
-        "name": name,
-        "description": description,
-        "images": images
-    })
+            raw = img_file.read()
+            image_hash = hashlib.sha256(raw).hexdigest()
+            contents[image_hash] = raw
+            image_hashes.append(image_hash)
+
+    # Only send the bytes of images the backend does not already store
+    check = api_call("check_images", {"email": email, "hashes": list(contents)})
+    missing = check.get("missing", list(contents)) if check.get("success") else list(contents)
+
+    for _ in range(2):
+        result = api_call("create_character", {
+            "email": email,
+            "name": name,
+            "description": description,
+            "image_hashes": image_hashes,
+            "images": {h: base64.b64encode(contents[h]).decode() for h in missing}
+        })
+        if result.get("success") or not result.get("missing"):
+            break
+        # An image was released between the check and the create; resend it
+        missing = list(set(missing) | set(result["missing"]))
     return result.get("success", False)
 
 def get_characters(email):
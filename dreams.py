@@ -17,3 +17,20 @@ def get_dreams(email):
     if result.get("success"):
         return result.get("dreams", [])
     return []
+
+def create_dream_batch(email, character_id, prompts, image_indexes):
+    """Fan out every prompt x image combination as one batch of dreams"""
+    result = api_call("create_dream_batch", {
+        "email": email,
+        "character_id": character_id,
+        "prompts": prompts,
+        "image_indexes": image_indexes
+    })
+    return result.get("success", False), result.get("batch_id")
+
+def get_dream_batch(email, batch_id):
+    """Get aggregate status and progress of a dream batch"""
+    result = api_call("get_dream_batch", {"email": email, "batch_id": batch_id})
+    if result.get("success"):
+        return result
+    return None
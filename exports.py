@@ -0,0 +1,13 @@
+from auth import api_call
+
+def start_export(email):
+    """Queue a zip export of all the user's characters and dreams"""
+    result = api_call("export", {"email": email})
+    return result.get("success", False), result.get("export_id")
+
+def get_export(email):
+    """Get progress of the latest export, with a download link once completed"""
+    result = api_call("get_export", {"email": email})
+    if result.get("success"):
+        return result.get("export")
+    return None
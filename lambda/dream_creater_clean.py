@@ -4,19 +4,48 @@ import os
 from datetime import datetime
 import uuid
 import base64
+import hashlib
+import time
+import io
+import zipfile
+import re
+from decimal import Decimal
+from boto3.dynamodb.conditions import Key, Attr
 
 dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
 users_table = dynamodb.Table("dream_users")
 characters_table = dynamodb.Table("dream_characters")
 dreams_table = dynamodb.Table("dream_videos")
+batches_table = dynamodb.Table("dream_batches")
+images_table = dynamodb.Table("dream_images")
+search_table = dynamodb.Table("dream_search")
 
 s3 = boto3.client("s3", region_name="us-east-1")
+lambda_client = boto3.client("lambda", region_name="us-east-1")
 S3_BUCKET = os.environ.get("S3_BUCKET", "dream-creator-images")
 
+DEMO_VIDEO_URL = "https://commondatastorage.googleapis.com/gtv-videos-bucket/sample/BigBuckBunny.mp4"
+# batch_write_item accepts at most 25 puts: the dreams plus their batch record
+MAX_BATCH_JOBS = 24
+RECENT_DREAMS_LIMIT = 5
+# Exports buffer one multipart part at a time (S3 minimum part size is 5 MiB)
+EXPORT_PART_SIZE = 8 * 1024 * 1024
+EXPORT_CHUNK_SIZE = 1024 * 1024
+# Stop an export with this much time left so it can abort and record failure
+EXPORT_TIME_MARGIN_MS = 30 * 1000
+SEARCH_MAX_TOKENS = 50
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 50
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
 def response(body, code=200):
     return {
         "statusCode": code,
-        "body": json.dumps(body),
+        "body": json.dumps(body, default=json_default),
         "headers": {
             "Content-Type": "application/json",
             "Access-Control-Allow-Origin": "*",
@@ -25,6 +54,392 @@ def response(body, code=200):
         }
     }
 
+# Images are deduplicated per user only: records and objects are keyed by the
+# owner's email, so one user can never probe for or reference another's photos
+def image_record_key(email, image_hash):
+    return {"image_hash": f"{email}#{image_hash}"}
+
+def image_key(email, image_hash):
+    return f"images/{email}/{image_hash}.jpg"
+
+def retain_image(email, image_hash, must_exist=False):
+    # Bump the reference count of a shared image object. With must_exist the
+    # update only succeeds for images already stored, so a client that skipped
+    # the upload is told to resend if the object was released in the meantime.
+    kwargs = {
+        "Key": image_record_key(email, image_hash),
+        "UpdateExpression": "ADD ref_count :one SET s3_key = :k",
+        "ExpressionAttributeValues": {":one": 1, ":k": image_key(email, image_hash)}
+    }
+    if must_exist:
+        kwargs["ConditionExpression"] = "attribute_exists(image_hash) AND ref_count > :zero"
+        kwargs["ExpressionAttributeValues"][":zero"] = 0
+    images_table.update_item(**kwargs)
+
+def release_image(email, image_hash):
+    res = images_table.update_item(
+        Key=image_record_key(email, image_hash),
+        UpdateExpression="ADD ref_count :minus",
+        ExpressionAttributeValues={":minus": -1},
+        ReturnValues="UPDATED_NEW"
+    )
+    if res["Attributes"].get("ref_count", 0) > 0:
+        return
+
+    # Last reference gone: drop the record first, and only remove the object
+    # if no other character grabbed a reference in between.
+    try:
+        images_table.delete_item(
+            Key=image_record_key(email, image_hash),
+            ConditionExpression="ref_count <= :zero",
+            ExpressionAttributeValues={":zero": 0}
+        )
+    except images_table.meta.client.exceptions.ConditionalCheckFailedException:
+        return
+
+    # A re-upload that raced the delete above has already written its object
+    # and recreated the record, so keep the object if the record is back.
+    # The remaining gap between this read and delete_object is accepted: it
+    # needs the same image to be re-uploaded within milliseconds of its last
+    # reference being dropped.
+    check = images_table.get_item(Key=image_record_key(email, image_hash), ConsistentRead=True)
+    if "Item" in check:
+        return
+    s3.delete_object(Bucket=S3_BUCKET, Key=image_key(email, image_hash))
+
+def scan_all(table, **kwargs):
+    # Scan filters are applied per 1 MB page, so follow LastEvaluatedKey
+    items = []
+    while True:
+        res = table.scan(**kwargs)
+        items.extend(res.get("Items", []))
+        if "LastEvaluatedKey" not in res:
+            return items
+        kwargs["ExclusiveStartKey"] = res["LastEvaluatedKey"]
+
+def rebuild_user_summary(email, force=False):
+    # Recount a user's summary from the tables. Users registered before the
+    # summary existed have no counters, and ADD on a missing counter would
+    # start it from the delta. Without force, only fills missing counters.
+    # Reads are strongly consistent so the item the caller just wrote or
+    # deleted is reflected in the recount.
+    characters = scan_all(characters_table, FilterExpression="email = :e", ExpressionAttributeValues={":e": email},
+                          ProjectionExpression="character_id", ConsistentRead=True)
+    dreams = scan_all(dreams_table, FilterExpression="email = :e", ExpressionAttributeValues={":e": email},
+                      ProjectionExpression="dream_id, created_at", ConsistentRead=True)
+    recent = sorted(dreams, key=lambda d: d.get("created_at", ""), reverse=True)[:RECENT_DREAMS_LIMIT]
+
+    condition = "attribute_exists(email)"
+    if not force:
+        condition += " AND attribute_not_exists(character_count)"
+    try:
+        users_table.update_item(
+            Key={"email": email},
+            # Running jobs are invisible in the tables, so keep their count;
+            # their completion updates will decrement it
+            UpdateExpression="SET character_count = :c, dream_count = :d, "
+                             "jobs_in_flight = if_not_exists(jobs_in_flight, :zero), "
+                             "recent_dream_ids = :ids, last_activity_at = :now",
+            ConditionExpression=condition,
+            ExpressionAttributeValues={
+                ":c": len(characters),
+                ":d": len(dreams),
+                ":zero": 0,
+                ":ids": [d["dream_id"] for d in recent],
+                ":now": datetime.now().strftime("%Y-%m-%d %H:%M")
+            }
+        )
+        return True
+    except users_table.meta.client.exceptions.ConditionalCheckFailedException:
+        return False
+
+def update_user_summary(email, characters=0, dreams=0, jobs=0, new_dream_ids=None, retry=True):
+    # Keep the per-user counters on the dream_users item current so the profile
+    # loads from a single get_item. Summary failures never fail the action.
+    sets = ["last_activity_at = :now"]
+    adds = []
+    values = {":now": datetime.now().strftime("%Y-%m-%d %H:%M")}
+    for attr, delta in (("character_count", characters), ("dream_count", dreams), ("jobs_in_flight", jobs)):
+        if delta:
+            adds.append(f"{attr} :{attr}")
+            values[f":{attr}"] = delta
+    if new_dream_ids:
+        sets.append("recent_dream_ids = list_append(:ids, if_not_exists(recent_dream_ids, :empty))")
+        values[":ids"] = list(reversed(new_dream_ids))
+        values[":empty"] = []
+
+    expression = "SET " + ", ".join(sets)
+    if adds:
+        expression += " ADD " + ", ".join(adds)
+
+    try:
+        res = users_table.update_item(
+            Key={"email": email},
+            UpdateExpression=expression,
+            ConditionExpression="attribute_exists(character_count)",
+            ExpressionAttributeValues=values,
+            ReturnValues="UPDATED_NEW"
+        )
+        recent = res.get("Attributes", {}).get("recent_dream_ids", [])
+        if len(recent) > RECENT_DREAMS_LIMIT:
+            stale = ", ".join(f"recent_dream_ids[{i}]" for i in range(RECENT_DREAMS_LIMIT, len(recent)))
+            users_table.update_item(Key={"email": email}, UpdateExpression=f"REMOVE {stale}")
+    except users_table.meta.client.exceptions.ConditionalCheckFailedException:
+        if not retry:
+            return
+        try:
+            if rebuild_user_summary(email):
+                # The recount already includes the item this action wrote; only a
+                # job that is starting is not visible in the tables yet
+                if jobs > 0:
+                    update_user_summary(email, jobs=jobs, retry=False)
+            else:
+                # Counters were created concurrently (or the user does not exist)
+                update_user_summary(email, characters, dreams, jobs, new_dream_ids, retry=False)
+        except Exception as e:
+            print(f"User summary rebuild failed for {email}: {str(e)}")
+    except Exception as e:
+        print(f"User summary update failed for {email}: {str(e)}")
+
+def forget_recent_dream(email, dream_id):
+    try:
+        user = users_table.get_item(Key={"email": email}, ProjectionExpression="recent_dream_ids")
+        recent = user.get("Item", {}).get("recent_dream_ids", [])
+        if dream_id in recent:
+            idx = recent.index(dream_id)
+            users_table.update_item(
+                Key={"email": email},
+                UpdateExpression=f"REMOVE recent_dream_ids[{idx}]",
+                ConditionExpression=f"recent_dream_ids[{idx}] = :id",
+                ExpressionAttributeValues={":id": dream_id}
+            )
+    except Exception as e:
+        print(f"Recent dream cleanup failed for {email}: {str(e)}")
+
+def tokenize(*texts):
+    tokens = []
+    for text in texts:
+        tokens.extend(re.findall(r"[a-z0-9]+", (text or "").lower()))
+    return list(dict.fromkeys(tokens))[:SEARCH_MAX_TOKENS]
+
+def search_entries(doc_type, item):
+    # One index entry per distinct token, keyed so that a begins_with query on
+    # the sort key reads exactly the entries whose token matches a prefix.
+    if doc_type == "dream":
+        doc_id = item["dream_id"]
+        tokens = tokenize(item.get("prompt"), item.get("character_name"))
+    else:
+        doc_id = item["character_id"]
+        tokens = tokenize(item.get("name"), item.get("description"))
+
+    entries = []
+    for token in tokens:
+        entry = {
+            "email": item["email"],
+            "term": f"{token}#{doc_type}#{doc_id}",
+            "doc_type": doc_type,
+            "doc_id": doc_id,
+            "created_at": item.get("created_at", "")
+        }
+        if item.get("status"):
+            entry["status"] = item["status"]
+        entries.append(entry)
+    return entries
+
+def index_documents(doc_type, items):
+    try:
+        with search_table.batch_writer(overwrite_by_pkeys=["email", "term"]) as batch:
+            for item in items:
+                for entry in search_entries(doc_type, item):
+                    batch.put_item(Item=entry)
+    except Exception as e:
+        print(f"Search indexing failed: {str(e)}")
+
+def unindex_documents(doc_type, items):
+    try:
+        with search_table.batch_writer(overwrite_by_pkeys=["email", "term"]) as batch:
+            for item in items:
+                for entry in search_entries(doc_type, item):
+                    batch.delete_item(Key={"email": entry["email"], "term": entry["term"]})
+    except Exception as e:
+        print(f"Search unindexing failed: {str(e)}")
+
+def search_matches(email, token, filter_expression=None):
+    # Read every index entry whose token starts with the given prefix
+    kwargs = {
+        "KeyConditionExpression": Key("email").eq(email) & Key("term").begins_with(token),
+        "ProjectionExpression": "doc_type, doc_id, created_at"
+    }
+    if filter_expression is not None:
+        kwargs["FilterExpression"] = filter_expression
+
+    matches = {}
+    while True:
+        res = search_table.query(**kwargs)
+        for entry in res.get("Items", []):
+            matches[(entry["doc_type"], entry["doc_id"])] = entry.get("created_at", "")
+        if "LastEvaluatedKey" not in res:
+            return matches
+        kwargs["ExclusiveStartKey"] = res["LastEvaluatedKey"]
+
+def generate_dream(email, character, prompt, image_index=0, batch_id=None):
+    # Callers validate image_index against the character's images
+    image_key_used = character["image_urls"][image_index]
+
+    item = {
+        "dream_id": str(uuid.uuid4()),
+        "email": email,
+        "character_id": character["character_id"],
+        "character_name": character.get("name", "Unknown"),
+        "prompt": prompt if prompt else "",
+        "image_key": image_key_used,
+        "video_s3_uri": "",
+        "video_url": DEMO_VIDEO_URL,
+        "status": "demo",
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M")
+    }
+    if batch_id:
+        item["batch_id"] = batch_id
+    return item
+
+def batch_write(request):
+    for attempt in range(5):
+        res = dynamodb.batch_write_item(RequestItems=request)
+        request = res.get("UnprocessedItems")
+        if not request:
+            return
+        time.sleep(0.1 * 2 ** attempt)
+    raise RuntimeError("Could not write all items in the batch")
+
+def batch_get(request):
+    # Returns {table_name: [items]}, retrying keys DynamoDB left unprocessed
+    items = {}
+    for attempt in range(5):
+        res = dynamodb.batch_get_item(RequestItems=request)
+        for table_name, found in res.get("Responses", {}).items():
+            items.setdefault(table_name, []).extend(found)
+        request = res.get("UnprocessedKeys")
+        if not request:
+            return items
+        time.sleep(0.1 * 2 ** attempt)
+    raise RuntimeError("Could not read all items in the batch")
+
+class MultipartUploadWriter:
+    # Write-only, unseekable file object that streams into an S3 multipart
+    # upload in fixed-size parts, so memory use is bounded by EXPORT_PART_SIZE.
+    def __init__(self, bucket, key, content_type="application/zip"):
+        self.bucket = bucket
+        self.key = key
+        self.upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, ContentType=content_type)["UploadId"]
+        self.parts = []
+        self.buffer = bytearray()
+        self.position = 0
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        while len(self.buffer) >= EXPORT_PART_SIZE:
+            self._upload_part(bytes(self.buffer[:EXPORT_PART_SIZE]))
+            del self.buffer[:EXPORT_PART_SIZE]
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def seekable(self):
+        return False
+
+    def seek(self, *args):
+        raise io.UnsupportedOperation("seek")
+
+    def flush(self):
+        pass
+
+    def _upload_part(self, data):
+        number = len(self.parts) + 1
+        res = s3.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=number, Body=data)
+        self.parts.append({"ETag": res["ETag"], "PartNumber": number})
+
+    def complete(self):
+        if self.buffer or not self.parts:
+            self._upload_part(bytes(self.buffer))
+            self.buffer = bytearray()
+        s3.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts}
+        )
+
+    def abort(self):
+        s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+def set_export_progress(email, export_id, **fields):
+    # Progress lives on the user item; the condition stops a superseded export
+    # from overwriting the status of a newer one.
+    fields["updated_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    names = {"#e": "last_export"}
+    values = {":id": export_id}
+    sets = []
+    for i, (field, value) in enumerate(fields.items()):
+        names[f"#f{i}"] = field
+        values[f":v{i}"] = value
+        sets.append(f"#e.#f{i} = :v{i}")
+    users_table.update_item(
+        Key={"email": email},
+        UpdateExpression="SET " + ", ".join(sets),
+        ConditionExpression="#e.export_id = :id",
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values
+    )
+
+def split_s3_uri(uri):
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    return bucket, key
+
+def run_export(email, export_id, context):
+    characters = scan_all(characters_table, FilterExpression="email = :e", ExpressionAttributeValues={":e": email})
+    dreams = scan_all(dreams_table, FilterExpression="email = :e", ExpressionAttributeValues={":e": email})
+
+    def check_time():
+        # A Lambda timeout would skip the cleanup below and leave the export
+        # "running" with a dangling multipart upload, so give up early instead
+        if context.get_remaining_time_in_millis() < EXPORT_TIME_MARGIN_MS:
+            raise TimeoutError("Export ran out of time")
+
+    files = []
+    for char in characters:
+        for i, key in enumerate(char.get("image_urls", [])):
+            files.append((S3_BUCKET, key, f"characters/{char['character_id']}/img_{i}.jpg"))
+    for dream in dreams:
+        if dream.get("video_s3_uri", "").startswith("s3://"):
+            bucket, key = split_s3_uri(dream["video_s3_uri"])
+            files.append((bucket, key, f"dreams/{dream['dream_id']}.mp4"))
+
+    export_key = f"exports/{email}/{export_id}.zip"
+    set_export_progress(email, export_id, items_total=len(files), items_done=0)
+
+    writer = MultipartUploadWriter(S3_BUCKET, export_key)
+    try:
+        # Media is already compressed, so entries are stored rather than deflated
+        with zipfile.ZipFile(writer, "w", compression=zipfile.ZIP_STORED) as archive:
+            archive.writestr("characters.json", json.dumps(characters, default=json_default, indent=2))
+            archive.writestr("dreams.json", json.dumps(dreams, default=json_default, indent=2))
+
+            for done, (bucket, key, name) in enumerate(files, start=1):
+                check_time()
+                body = s3.get_object(Bucket=bucket, Key=key)["Body"]
+                with archive.open(name, "w", force_zip64=True) as entry:
+                    for chunk in body.iter_chunks(EXPORT_CHUNK_SIZE):
+                        check_time()
+                        entry.write(chunk)
+                set_export_progress(email, export_id, items_done=done, bytes_written=writer.tell())
+
+        writer.complete()
+    except Exception:
+        writer.abort()
+        raise
+
+    set_export_progress(email, export_id, status="completed", s3_key=export_key, bytes_written=writer.tell())
+
 def lambda_handler(event, context):
     if event.get("requestContext", {}).get("http", {}).get("method") == "OPTIONS":
         return response({"message": "OK"})
@@ -55,6 +470,10 @@ def lambda_handler(event, context):
                 "email": email,
                 "name": name,
                 "password": password,
+                "character_count": 0,
+                "dream_count": 0,
+                "jobs_in_flight": 0,
+                "recent_dream_ids": [],
                 "created_at": datetime.now().strftime("%Y-%m-%d %H:%M")
             })
 
@@ -84,34 +503,89 @@ def lambda_handler(event, context):
         except Exception as e:
             return response({"error": str(e)}, 500)
 
+    elif action == "check_images":
+        email = body.get("email")
+        hashes = body.get("hashes", [])
+
+        if not email:
+            return response({"error": "Missing fields"}, 400)
+
+        try:
+            if not isinstance(hashes, list) or not all(isinstance(h, str) for h in hashes):
+                return response({"error": "hashes must be a list of strings"}, 400)
+            if len(hashes) > 3:
+                return response({"error": "At most 3 images per character"}, 400)
+
+            existing = set()
+            keys = [image_record_key(email, h) for h in dict.fromkeys(hashes)]
+            if keys:
+                found = batch_get({
+                    "dream_images": {"Keys": keys, "ProjectionExpression": "image_hash, ref_count"}
+                })
+                for item in found.get("dream_images", []):
+                    if item.get("ref_count", 0) > 0:
+                        existing.add(item["image_hash"].rsplit("#", 1)[1])
+
+            missing = [h for h in hashes if h not in existing]
+            return response({"success": True, "missing": missing})
+
+        except Exception as e:
+            return response({"error": str(e)}, 500)
+
     elif action == "create_character":
         email = body.get("email")
         name = body.get("name")
         description = body.get("description", "")
-        images = body.get("images", [])
+        image_hashes = body.get("image_hashes", [])[:3]
+        images = body.get("images", {})
 
         if not email or not name:
             return response({"error": "Missing fields"}, 400)
 
         try:
             char_id = str(uuid.uuid4())
-            uploaded_keys = []
-
-            for i, img_b64 in enumerate(images[:3]):
+            uploads = {}
+            for image_hash, img_b64 in images.items():
                 raw = base64.b64decode(img_b64)
-                key = f"characters/{email}/{char_id}/img_{i}.jpg"
-                s3.put_object(Bucket=S3_BUCKET, Key=key, Body=raw, ContentType="image/jpeg")
-                uploaded_keys.append(key)
+                if hashlib.sha256(raw).hexdigest() != image_hash:
+                    return response({"error": f"Image content does not match hash {image_hash}"}, 400)
+                uploads[image_hash] = raw
 
-            characters_table.put_item(Item={
-                "character_id": char_id,
-                "email": email,
-                "name": name,
-                "description": description,
-                "image_urls": uploaded_keys,
-                "created_at": datetime.now().strftime("%Y-%m-%d %H:%M")
-            })
+            retained = []
+            try:
+                for image_hash in image_hashes:
+                    if image_hash in uploads:
+                        # Write the bytes before taking a reference, so check_images
+                        # never reports an image whose object is not stored yet
+                        s3.put_object(Bucket=S3_BUCKET, Key=image_key(email, image_hash), Body=uploads[image_hash], ContentType="image/jpeg")
+                        retain_image(email, image_hash)
+                        retained.append(image_hash)
+                    else:
+                        try:
+                            retain_image(email, image_hash, must_exist=True)
+                        except images_table.meta.client.exceptions.ConditionalCheckFailedException:
+                            for h in retained:
+                                release_image(email, h)
+                            return response({"error": "Image not stored, please upload it", "missing": [image_hash]}, 409)
+                        retained.append(image_hash)
+
+                character = {
+                    "character_id": char_id,
+                    "email": email,
+                    "name": name,
+                    "description": description,
+                    "image_hashes": image_hashes,
+                    "image_urls": [image_key(email, h) for h in image_hashes],
+                    "created_at": datetime.now().strftime("%Y-%m-%d %H:%M")
+                }
+                characters_table.put_item(Item=character)
+            except Exception:
+                for h in retained:
+                    release_image(email, h)
+                raise
 
+            update_user_summary(email, characters=1)
+            index_documents("character", [character])
             return response({"success": True, "character_id": char_id})
 
         except Exception as e:
@@ -147,6 +621,36 @@ def lambda_handler(event, context):
         except Exception as e:
             return response({"error": str(e)}, 500)
 
+    elif action == "delete_character":
+        email = body.get("email")
+        character_id = body.get("character_id")
+
+        if not email or not character_id:
+            return response({"error": "Missing fields"}, 400)
+
+        try:
+            char_data = characters_table.get_item(Key={"character_id": character_id})
+            if "Item" not in char_data or char_data["Item"].get("email") != email:
+                return response({"error": "Character not found"}, 404)
+
+            character = char_data["Item"]
+            characters_table.delete_item(Key={"character_id": character_id})
+            update_user_summary(email, characters=-1)
+            unindex_documents("character", [character])
+
+            if "image_hashes" in character:
+                for image_hash in character["image_hashes"]:
+                    release_image(email, image_hash)
+            else:
+                # Characters created before shared storage own their objects
+                for key in character.get("image_urls", []):
+                    s3.delete_object(Bucket=S3_BUCKET, Key=key)
+
+            return response({"success": True})
+
+        except Exception as e:
+            return response({"error": str(e)}, 500)
+
     elif action == "create_dream":
         email = body.get("email")
         character_id = body.get("character_id")
@@ -155,9 +659,64 @@ def lambda_handler(event, context):
         if not email or not character_id:
             return response({"error": "Missing fields"}, 400)
 
-        dream_id = str(uuid.uuid4())
+        try:
+            char_data = characters_table.get_item(Key={"character_id": character_id})
+            if "Item" not in char_data:
+                return response({"error": "Character not found"}, 404)
+
+            character = char_data["Item"]
+
+            if not character.get("image_urls"):
+                return response({"error": "No character images found"}, 400)
+
+            image_index = body.get("selected_image_index")
+            image_index = 0 if image_index is None else image_index
+            if not isinstance(image_index, int) or not 0 <= image_index < len(character["image_urls"]):
+                return response({"error": "Invalid selected_image_index"}, 400)
+
+            update_user_summary(email, jobs=1)
+            try:
+                dream = generate_dream(email, character, prompt, image_index)
+                dreams_table.put_item(Item=dream)
+            except Exception:
+                update_user_summary(email, jobs=-1)
+                raise
+            update_user_summary(email, dreams=1, jobs=-1, new_dream_ids=[dream["dream_id"]])
+            index_documents("dream", [dream])
+
+            return response({
+                "success": True,
+                "dream_id": dream["dream_id"],
+                "video_url": dream["video_url"],
+                "status": dream["status"]
+            })
+
+        except Exception as e:
+            print(f"Dream creation failed: {str(e)}")
+            return response({"error": str(e)}, 500)
+
+    elif action == "create_dream_batch":
+        email = body.get("email")
+        character_id = body.get("character_id")
+        prompts = body.get("prompts") or [""]
+        image_indexes = body.get("image_indexes") or [0]
+
+        if not email or not character_id:
+            return response({"error": "Missing fields"}, 400)
+
+        batch_id = str(uuid.uuid4())
 
         try:
+            if not isinstance(prompts, list) or not all(isinstance(p, str) for p in prompts):
+                return response({"error": "prompts must be a list of strings"}, 400)
+            if not isinstance(image_indexes, list) or not all(isinstance(i, int) for i in image_indexes):
+                return response({"error": "image_indexes must be a list of integers"}, 400)
+
+            prompts = list(dict.fromkeys(prompts))
+            image_indexes = list(dict.fromkeys(image_indexes))
+            if len(prompts) * len(image_indexes) > MAX_BATCH_JOBS:
+                return response({"error": f"A batch can hold at most {MAX_BATCH_JOBS} dreams"}, 400)
+
             char_data = characters_table.get_item(Key={"character_id": character_id})
             if "Item" not in char_data:
                 return response({"error": "Character not found"}, 404)
@@ -167,30 +726,81 @@ def lambda_handler(event, context):
             if not character.get("image_urls"):
                 return response({"error": "No character images found"}, 400)
 
-            video_url = "https://commondatastorage.googleapis.com/gtv-videos-bucket/sample/BigBuckBunny.mp4"
-            status = "demo"
+            invalid = [i for i in image_indexes if not 0 <= i < len(character["image_urls"])]
+            if invalid:
+                return response({"error": f"Invalid image_indexes: {invalid}"}, 400)
 
-            dreams_table.put_item(Item={
-                "dream_id": dream_id,
-                "email": email,
-                "character_id": character_id,
-                "character_name": character.get("name", "Unknown"),
-                "prompt": prompt if prompt else "",
-                "video_s3_uri": "",
-                "video_url": video_url,
-                "status": status,
-                "created_at": datetime.now().strftime("%Y-%m-%d %H:%M")
+            jobs = len(prompts) * len(image_indexes)
+            update_user_summary(email, jobs=jobs)
+            try:
+                dreams = [
+                    generate_dream(email, character, prompt, idx, batch_id)
+                    for prompt in prompts for idx in image_indexes
+                ]
+                dream_ids = [d["dream_id"] for d in dreams]
+
+                # One call stores every dream and the batch record listing them
+                batch_write({
+                    "dream_videos": [{"PutRequest": {"Item": d}} for d in dreams],
+                    "dream_batches": [{"PutRequest": {"Item": {
+                        "batch_id": batch_id,
+                        "email": email,
+                        "character_id": character_id,
+                        "dream_ids": dream_ids,
+                        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M")
+                    }}}]
+                })
+            except Exception:
+                update_user_summary(email, jobs=-jobs)
+                raise
+            update_user_summary(email, dreams=len(dreams), jobs=-jobs, new_dream_ids=dream_ids)
+            index_documents("dream", dreams)
+
+            return response({
+                "success": True,
+                "batch_id": batch_id,
+                "dream_ids": dream_ids,
+                "total": len(dreams)
             })
 
+        except Exception as e:
+            print(f"Batch creation failed: {str(e)}")
+            return response({"error": str(e)}, 500)
+
+    elif action == "get_dream_batch":
+        email = body.get("email")
+        batch_id = body.get("batch_id")
+
+        if not email or not batch_id:
+            return response({"error": "Missing fields"}, 400)
+
+        try:
+            batch_data = batches_table.get_item(Key={"batch_id": batch_id})
+            if "Item" not in batch_data or batch_data["Item"].get("email") != email:
+                return response({"error": "Batch not found"}, 404)
+
+            dream_ids = batch_data["Item"].get("dream_ids", [])
+            found = batch_get({"dream_videos": {"Keys": [{"dream_id": d} for d in dream_ids]}}) if dream_ids else {}
+            dreams = found.get("dream_videos", [])
+
+            counts = {}
+            for dream in dreams:
+                status = dream.get("status", "unknown")
+                counts[status] = counts.get(status, 0) + 1
+            if len(dreams) < len(dream_ids):
+                counts["deleted"] = len(dream_ids) - len(dreams)
+            finished = len(dream_ids) - counts.get("processing", 0)
+
             return response({
                 "success": True,
-                "dream_id": dream_id,
-                "video_url": video_url,
-                "status": status
+                "batch_id": batch_id,
+                "total": len(dream_ids),
+                "counts": counts,
+                "progress": finished / len(dream_ids) if dream_ids else 0,
+                "dreams": dreams
             })
 
         except Exception as e:
-            print(f"Dream creation failed: {str(e)}")
             return response({"error": str(e)}, 500)
 
     elif action == "get_dreams":
@@ -210,8 +820,242 @@ def lambda_handler(event, context):
     elif action == "delete_dream":
         dream_id = body.get("dream_id")
         try:
-            dreams_table.delete_item(Key={"dream_id": dream_id})
+            res = dreams_table.delete_item(Key={"dream_id": dream_id}, ReturnValues="ALL_OLD")
+            dream = res.get("Attributes")
+            if dream:
+                update_user_summary(dream["email"], dreams=-1)
+                forget_recent_dream(dream["email"], dream_id)
+                unindex_documents("dream", [dream])
+            return response({"success": True})
+        except Exception as e:
+            return response({"error": str(e)}, 500)
+
+    elif action == "get_summary":
+        email = body.get("email")
+
+        if not email:
+            return response({"error": "Missing fields"}, 400)
+
+        try:
+            user_item = users_table.get_item(
+                Key={"email": email},
+                ProjectionExpression="email, character_count, dream_count, jobs_in_flight, last_activity_at, recent_dream_ids"
+            )
+            if "Item" not in user_item:
+                return response({"error": "User not found"}, 404)
+
+            item = user_item["Item"]
+            if "character_count" not in item:
+                rebuild_user_summary(email)
+                item = users_table.get_item(
+                    Key={"email": email},
+                    ProjectionExpression="email, character_count, dream_count, jobs_in_flight, last_activity_at, recent_dream_ids"
+                )["Item"]
+
+            return response({"success": True, "summary": {
+                "character_count": item.get("character_count", 0),
+                "dream_count": item.get("dream_count", 0),
+                "jobs_in_flight": item.get("jobs_in_flight", 0),
+                "last_activity_at": item.get("last_activity_at"),
+                "recent_dream_ids": item.get("recent_dream_ids", [])
+            }})
+
+        except Exception as e:
+            return response({"error": str(e)}, 500)
+
+    elif action == "rebuild_summary":
+        email = body.get("email")
+
+        if not email:
+            return response({"error": "Missing fields"}, 400)
+
+        try:
+            if not rebuild_user_summary(email, force=True):
+                return response({"error": "User not found"}, 404)
             return response({"success": True})
+
+        except Exception as e:
+            return response({"error": str(e)}, 500)
+
+    elif action == "export":
+        email = body.get("email")
+
+        if not email:
+            return response({"error": "Missing fields"}, 400)
+
+        export_id = str(uuid.uuid4())
+
+        try:
+            users_table.update_item(
+                Key={"email": email},
+                UpdateExpression="SET last_export = :export",
+                ConditionExpression="attribute_exists(email)",
+                ExpressionAttributeValues={":export": {
+                    "export_id": export_id,
+                    "status": "queued",
+                    "items_done": 0,
+                    "items_total": 0,
+                    "bytes_written": 0,
+                    "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                }}
+            )
+
+            # Archive building can outlast the caller, so run it asynchronously
+            lambda_client.invoke(
+                FunctionName=context.function_name,
+                InvocationType="Event",
+                Payload=json.dumps({"body": json.dumps({
+                    "action": "run_export",
+                    "email": email,
+                    "export_id": export_id
+                })})
+            )
+
+            return response({"success": True, "export_id": export_id, "status": "queued"})
+
+        except Exception as e:
+            return response({"error": str(e)}, 500)
+
+    elif action == "run_export":
+        email = body.get("email")
+        export_id = body.get("export_id")
+
+        if not email or not export_id:
+            return response({"error": "Missing fields"}, 400)
+
+        try:
+            # Claim the export atomically: duplicate async deliveries or direct
+            # calls find it already running and back off
+            try:
+                users_table.update_item(
+                    Key={"email": email},
+                    UpdateExpression="SET last_export.#s = :running",
+                    ConditionExpression="last_export.export_id = :id AND last_export.#s = :queued",
+                    ExpressionAttributeNames={"#s": "status"},
+                    ExpressionAttributeValues={":id": export_id, ":queued": "queued", ":running": "running"}
+                )
+            except users_table.meta.client.exceptions.ConditionalCheckFailedException:
+                return response({"error": "Export not queued"}, 409)
+
+            run_export(email, export_id, context)
+            return response({"success": True})
+
+        except Exception as e:
+            print(f"Export {export_id} failed: {str(e)}")
+            try:
+                set_export_progress(email, export_id, status="failed", error=str(e))
+            except Exception:
+                pass
+            return response({"error": str(e)}, 500)
+
+    elif action == "get_export":
+        email = body.get("email")
+
+        if not email:
+            return response({"error": "Missing fields"}, 400)
+
+        try:
+            user_item = users_table.get_item(Key={"email": email}, ProjectionExpression="last_export")
+            export = user_item.get("Item", {}).get("last_export")
+            if not export:
+                return response({"error": "No export found"}, 404)
+
+            if export.get("status") == "completed":
+                export["download_url"] = s3.generate_presigned_url(
+                    "get_object",
+                    Params={"Bucket": S3_BUCKET, "Key": export["s3_key"]},
+                    ExpiresIn=3600
+                )
+
+            return response({"success": True, "export": export})
+
+        except Exception as e:
+            return response({"error": str(e)}, 500)
+
+    elif action == "search":
+        email = body.get("email")
+        tokens = tokenize(body.get("query"))
+        doc_types = body.get("types") or ["dream", "character"]
+        status = body.get("status")
+        date_from = body.get("date_from")
+        date_to = body.get("date_to")
+
+        if not email or not tokens:
+            return response({"error": "Missing fields"}, 400)
+
+        try:
+            try:
+                page_size = min(max(int(body.get("page_size") or SEARCH_PAGE_SIZE), 1), SEARCH_MAX_PAGE_SIZE)
+                offset = max(int(body.get("cursor") or 0), 0)
+            except (TypeError, ValueError):
+                return response({"error": "Invalid page_size or cursor"}, 400)
+            if not isinstance(doc_types, list):
+                return response({"error": "types must be a list"}, 400)
+
+            filters = [Attr("doc_type").is_in(doc_types)]
+            if status:
+                filters.append(Attr("status").eq(status))
+            if date_from:
+                filters.append(Attr("created_at").gte(date_from))
+            if date_to:
+                # created_at is "YYYY-MM-DD HH:MM", so include the whole end day
+                filters.append(Attr("created_at").lte(f"{date_to} 23:59"))
+            filter_expression = filters[0]
+            for condition in filters[1:]:
+                filter_expression = filter_expression & condition
+
+            # Every query word is a prefix; a document must match all of them
+            matches = None
+            for token in sorted(tokens, key=len, reverse=True):
+                found = search_matches(email, token, filter_expression)
+                matches = found if matches is None else {k: v for k, v in matches.items() if k in found}
+                if not matches:
+                    break
+
+            ranked = sorted(matches.items(), key=lambda m: (m[1], m[0][1]), reverse=True)
+            page = [doc for doc, _ in ranked[offset:offset + page_size]]
+
+            items = {}
+            if page:
+                tables = {"dream": ("dream_videos", "dream_id"), "character": ("dream_characters", "character_id")}
+                request = {}
+                for doc_type, doc_id in page:
+                    table_name, key_name = tables[doc_type]
+                    request.setdefault(table_name, {"Keys": []})["Keys"].append({key_name: doc_id})
+                found = batch_get(request)
+                for item in found.get("dream_videos", []):
+                    items[("dream", item["dream_id"])] = item
+                for item in found.get("dream_characters", []):
+                    items[("character", item["character_id"])] = item
+
+            results = [{"type": doc[0], "item": items[doc]} for doc in page if doc in items]
+            next_offset = offset + page_size
+
+            return response({
+                "success": True,
+                "results": results,
+                "total": len(ranked),
+                "next_cursor": str(next_offset) if next_offset < len(ranked) else None
+            })
+
+        except Exception as e:
+            return response({"error": str(e)}, 500)
+
+    elif action == "reindex":
+        email = body.get("email")
+
+        if not email:
+            return response({"error": "Missing fields"}, 400)
+
+        try:
+            characters = scan_all(characters_table, FilterExpression="email = :e", ExpressionAttributeValues={":e": email})
+            dreams = scan_all(dreams_table, FilterExpression="email = :e", ExpressionAttributeValues={":e": email})
+
+            index_documents("character", characters)
+            index_documents("dream", dreams)
+
+            return response({"success": True, "characters": len(characters), "dreams": len(dreams)})
+
         except Exception as e:
             return response({"error": str(e)}, 500)
 
@@ -0,0 +1,16 @@
+from auth import api_call
+
+def search(email, query, status=None, date_from=None, date_to=None, cursor=None, page_size=20):
+    """Prefix search over dream prompts and character names and descriptions"""
+    result = api_call("search", {
+        "email": email,
+        "query": query,
+        "status": status,
+        "date_from": date_from,
+        "date_to": date_to,
+        "cursor": cursor,
+        "page_size": page_size
+    })
+    if result.get("success"):
+        return result.get("results", []), result.get("total", 0), result.get("next_cursor")
+    return [], 0, None
@@ -1,15 +1,42 @@
 # session_manager.py
+import time
 import streamlit as st
 
+# Presigned URLs in cached listings expire after an hour, so refresh well before
+CACHE_TTL_SECONDS = 1800
+
 def init_session():
     if "user" not in st.session_state:
         st.session_state.user = None
+    if "data_cache" not in st.session_state:
+        st.session_state.data_cache = {}
 
 def login_user(user_data):
     st.session_state.user = user_data
+    st.session_state.data_cache = {}
+    st.session_state.pop("last_batch_id", None)
+    st.session_state.pop("export_id", None)
+    st.session_state.pop("search_params", None)
 
 def logout_user():
     st.session_state.user = None
+    st.session_state.data_cache = {}
+    st.session_state.pop("last_batch_id", None)
+    st.session_state.pop("export_id", None)
+    st.session_state.pop("search_params", None)
 
 def is_logged_in():
     return st.session_state.user is not None
+
+def cached(key, loader):
+    """Return per-session data, calling loader only on first use or after expiry"""
+    entry = st.session_state.data_cache.get(key)
+    if entry is None or time.time() - entry[0] > CACHE_TTL_SECONDS:
+        entry = (time.time(), loader())
+        st.session_state.data_cache[key] = entry
+    return entry[1]
+
+def invalidate(*keys):
+    """Drop cached data so the next reader fetches it again"""
+    for key in keys:
+        st.session_state.data_cache.pop(key, None)
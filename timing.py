@@ -0,0 +1,31 @@
+# timing.py
+import os
+import time
+from functools import wraps
+import streamlit as st
+
+MAX_SAMPLES = 50
+# Set DREAM_TIMING_LOG=1 to also print every sample to stdout
+LOG_TIMINGS = os.getenv("DREAM_TIMING_LOG") == "1"
+
+def record_run(name, started):
+    """Store how long a script or fragment run took, in milliseconds"""
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    samples = st.session_state.setdefault("run_times", {}).setdefault(name, [])
+    samples.append(elapsed_ms)
+    del samples[:-MAX_SAMPLES]
+    if LOG_TIMINGS:
+        print(f"[timing] {name}: {elapsed_ms:.1f} ms")
+
+def timed(name):
+    """Decorator recording the run time of a section under the given name"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record_run(name, started)
+        return wrapper
+    return decorator